@@ -1,15 +1,23 @@
 import os
-import json
+import asyncio
+import collections
+import itertools
 import time
 import queue
 import threading
-import tempfile
 import subprocess
+import sys
 import logging
 import re
+import select
+import hashlib
+import orjson
 import requests
 import shutil
+import signal
 import sqlite3
+import tempfile
+import tomllib
 
 from flask import (
     Flask,
@@ -19,7 +27,18 @@ from flask import (
     Response,
     stream_with_context,
 )
+from flask.json.provider import JSONProvider
 from functools import wraps
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from streamrip.config import Config as StreamripConfig
+    from streamrip.metadata import SearchResults
+    from streamrip.rip.main import Main as StreamripMain
+except ImportError:
+    # rip may live in its own environment (e.g. pipx); fall back to the CLI
+    StreamripMain = None
 
 # ------------------------------------------------------------------------------
 # Authentication
@@ -57,17 +76,50 @@ logger = logging.getLogger(__name__)
 # ------------------------------------------------------------------------------
 # App setup
 # ------------------------------------------------------------------------------
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 DOWNLOADS_DB = "/config/streamrip/downloads.db"
 STREAMRIP_CONFIG = os.environ.get("STREAMRIP_CONFIG", "/config/streamrip/config.toml")
+HISTORY_DB = os.environ.get(
+    "HISTORY_DB", os.path.join(os.path.dirname(STREAMRIP_CONFIG), "history.db")
+)
 DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", "/music")
 MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", "2"))
+RIP_BIN = shutil.which("rip") or "rip"
+RIP_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rip_worker.py")
+RIP_WORKER_DONE = "__rip_worker_done__ "  # must match DONE in rip_worker.py
+
+# hosts `rip url` knows how to resolve (mirrors streamrip's parse_url)
+SUPPORTED_URL_RE = re.compile(
+    r"^https?://(?:"
+    r"(?:www\.|open\.|play\.|listen\.)?(?:qobuz|tidal|deezer)\.com/"
+    r"|soundcloud\.com/"
+    r"|deezer\.page\.link/"
+    r")\S+$"
+)
 
-download_queue = queue.Queue()
+HISTORY_SIZE = 200
+HISTORY_OUTPUT_LINES = 200
+PROGRESS_INTERVAL = 0.25
+CONFIG_CHECK_INTERVAL = 60
+SSE_QUEUE_SIZE = 256
+
+download_queue = queue.SimpleQueue()
 active_downloads = {}
-download_history = []
-sse_clients = []
+# seeded from the clock so ids stay unique across restarts (history.db)
+task_ids = itertools.count(int(time.time() * 1000))
+download_history = collections.deque(maxlen=HISTORY_SIZE)
+sse_clients = ()
+sse_clients_lock = threading.Lock()
 
 
 @app.before_request
@@ -101,38 +153,87 @@ def enforce_auth():
 
 
 
+# ------------------------------------------------------------------------------
+# HTTP caching helpers
+# ------------------------------------------------------------------------------
+def etag_matches(etag):
+    return request.if_none_match.contains(etag)
+
+
+def with_cache_headers(resp, etag, cache_control):
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+
+def not_modified(etag, cache_control):
+    return with_cache_headers(Response(status=304), etag, cache_control)
+
 # ------------------------------------------------------------------------------
 # SSE helpers
 # ------------------------------------------------------------------------------
+SSE_CONNECTED = b'data: {"type":"connected"}\n\n'
+SSE_KEEPALIVE = b": ping\n\n"
+SSE_KEEPALIVE_INTERVAL = 30
+
+
+class SSEClient:
+    # the deque drops the oldest frames once a slow client falls
+    # SSE_QUEUE_SIZE behind, so one stuck browser can't grow memory
+    def __init__(self):
+        self.messages = collections.deque(maxlen=SSE_QUEUE_SIZE)
+        self.ready = threading.Event()
+
+    def push(self, msg):
+        self.messages.append(msg)
+        self.ready.set()
+
+
 def broadcast_sse(data):
-    msg = f"data: {json.dumps(data)}\n\n"
-    dead = []
+    msg = b"data: " + orjson.dumps(data) + b"\n\n"
 
-    for q in sse_clients:
-        try:
-            q.put(msg)
-        except Exception:
-            dead.append(q)
+    # sse_clients is an immutable tuple replaced on (un)register, so
+    # reading it needs no lock and no copy
+    for client in sse_clients:
+        client.push(msg)
+
+
+def register_sse_client(client):
+    global sse_clients
+    with sse_clients_lock:
+        sse_clients = sse_clients + (client,)
 
-    for q in dead:
-        sse_clients.remove(q)
+
+def unregister_sse_client(client):
+    global sse_clients
+    with sse_clients_lock:
+        sse_clients = tuple(c for c in sse_clients if c is not client)
 
 
 @app.route("/api/events")
 def sse_events():
     def gen():
-        q = queue.Queue()
-        sse_clients.append(q)
+        client = SSEClient()
+        register_sse_client(client)
         try:
-            yield 'data: {"type":"connected"}\n\n'
+            yield SSE_CONNECTED
             while True:
-                try:
-                    yield q.get(timeout=30)
-                except queue.Empty:
+                if not client.ready.wait(timeout=SSE_KEEPALIVE_INTERVAL):
+                    # comment frame so idle proxies don't cut the stream
+                    yield SSE_KEEPALIVE
                     continue
+
+                # clear before draining so a push that lands meanwhile
+                # re-arms the event instead of being missed
+                client.ready.clear()
+                batch = []
+                while client.messages:
+                    batch.append(client.messages.popleft())
+
+                if batch:
+                    yield b"".join(batch)
         finally:
-            if q in sse_clients:
-                sse_clients.remove(q)
+            unregister_sse_client(client)
 
     return Response(
         stream_with_context(gen()),
@@ -140,12 +241,214 @@ def sse_events():
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
+# ------------------------------------------------------------------------------
+# Download history
+# ------------------------------------------------------------------------------
+def open_history_db():
+    try:
+        os.makedirs(os.path.dirname(HISTORY_DB), exist_ok=True)
+        conn = sqlite3.connect(
+            HISTORY_DB, check_same_thread=False, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id TEXT PRIMARY KEY, completed_at REAL, status TEXT, "
+            "metadata TEXT, output TEXT)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS history_completed_at "
+            "ON history(completed_at)"
+        )
+        return conn
+
+    except (OSError, sqlite3.Error):
+        # e.g. running locally without /config; keep history in memory
+        logger.exception("Could not open history database %s", HISTORY_DB)
+        return None
+
+
+history_db = open_history_db()
+history_db_lock = threading.Lock()
+
+
+def record_history(entry):
+    if history_db is None:
+        download_history.append(entry)
+        return
+
+    try:
+        with history_db_lock:
+            history_db.execute(
+                "INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?)",
+                (
+                    entry["id"],
+                    entry["completed_at"],
+                    entry["status"],
+                    orjson.dumps(entry["metadata"]).decode(),
+                    entry["output"],
+                ),
+            )
+            # keep only what /api/history can return
+            history_db.execute(
+                "DELETE FROM history WHERE id NOT IN ("
+                "SELECT id FROM history ORDER BY completed_at DESC LIMIT ?)",
+                (HISTORY_SIZE,),
+            )
+
+    except sqlite3.Error:
+        # a full disk or a locked database must not kill the worker thread
+        logger.exception("Failed to record history for %s", entry["id"])
+
+
+def history_lines(limit=HISTORY_SIZE):
+    # newest first, one JSON object per line
+    if history_db is None:
+        entries = list(reversed(download_history))
+    else:
+        with history_db_lock:
+            rows = history_db.execute(
+                "SELECT id, completed_at, status, metadata, output FROM history "
+                "ORDER BY completed_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+        entries = (
+            {
+                "id": row[0],
+                "completed_at": row[1],
+                "status": row[2],
+                "metadata": orjson.loads(row[3]),
+                "output": row[4],
+            }
+            for row in rows
+        )
+
+    for entry in entries:
+        yield orjson.dumps(entry) + b"\n"
+
 # ------------------------------------------------------------------------------
 # Download worker
 # ------------------------------------------------------------------------------
+config_args_cache = {"checked": None, "args": []}
+
+
+def rip_config_args():
+    # the config file practically never appears or disappears at runtime,
+    # so only stat it once a minute instead of on every rip invocation
+    now = time.monotonic()
+    checked = config_args_cache["checked"]
+    if checked is None or now - checked >= CONFIG_CHECK_INTERVAL:
+        config_args_cache["args"] = (
+            ["--config-path", STREAMRIP_CONFIG]
+            if os.path.exists(STREAMRIP_CONFIG)
+            else []
+        )
+        config_args_cache["checked"] = now
+
+    return config_args_cache["args"]
+
+
+def reload_config_args():
+    config_args_cache["checked"] = None
+    return rip_config_args()
+
+
+def read_lines(stream, chunk_size=65536, idle=PROGRESS_INTERVAL):
+    # pull whatever the pipe has in one read and decode a batch of lines
+    # at once, instead of going through the text layer line by line;
+    # yields None whenever the pipe stays quiet for `idle` seconds
+    fd = stream.fileno()
+    buf = b""
+    while True:
+        if not select.select([fd], [], [], idle)[0]:
+            yield None
+            continue
+
+        chunk = os.read(fd, chunk_size)
+        if not chunk:
+            break
+
+        *lines, buf = (buf + chunk).split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", "replace").rstrip()
+
+    if buf:
+        yield buf.decode("utf-8", "replace").rstrip()
+
+
 class DownloadWorker(threading.Thread):
     daemon = True
 
+    def __init__(self):
+        super().__init__()
+        self.rip_proc = None
+        self.rip_lines = None
+
+    def rip_worker(self):
+        # one long-lived rip_worker.py per download thread keeps streamrip
+        # imported and its clients logged in between downloads; restarted
+        # whenever it exits (crash, cancel)
+        if self.rip_proc is None or self.rip_proc.poll() is not None:
+            self.rip_proc = subprocess.Popen(
+                [sys.executable, "-u", RIP_WORKER, STREAMRIP_CONFIG],
+                bufsize=65536,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+            self.rip_lines = read_lines(self.rip_proc.stdout)
+
+        return self.rip_proc, self.rip_lines
+
+    def stream_output(self, task_id, lines, output):
+        # returns the rip_worker result, or None if the stream just ended
+        pending = []
+        last_sent = 0.0
+        result = None
+
+        for line in lines:
+            if line is None:
+                # pipe went quiet: send what's held back by the throttle
+                # instead of waiting for rip's next line
+                if pending:
+                    broadcast_sse({
+                        "type": "download_progress",
+                        "id": task_id,
+                        "lines": pending,
+                    })
+                    pending = []
+                    last_sent = time.monotonic()
+                continue
+
+            if line.startswith(RIP_WORKER_DONE):
+                result = orjson.loads(line[len(RIP_WORKER_DONE):])
+                break
+
+            output.append(line)
+            pending.append(line)
+
+            now = time.monotonic()
+            if now - last_sent >= PROGRESS_INTERVAL:
+                broadcast_sse({
+                    "type": "download_progress",
+                    "id": task_id,
+                    "lines": pending,
+                })
+                pending = []
+                last_sent = now
+
+        if pending:
+            broadcast_sse({
+                "type": "download_progress",
+                "id": task_id,
+                "lines": pending,
+            })
+
+        return result
+
     def run(self):
         while True:
             task = download_queue.get()
@@ -169,42 +472,71 @@ class DownloadWorker(threading.Thread):
                 "metadata": metadata,
             })
 
-            cmd = ["rip"]
-            if os.path.exists(STREAMRIP_CONFIG):
-                cmd += ["--config-path", STREAMRIP_CONFIG]
-
-            cmd += ["-f", DOWNLOAD_DIR, "-q", str(quality), "url", url]
-
-            output = []
+            # the client builds the live log from the progress events, so
+            # only the tail that goes into history needs to be kept here
+            output = collections.deque(maxlen=HISTORY_OUTPUT_LINES)
+            status = "failed"
+            log = None
 
             try:
-                proc = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                )
-
-                for line in proc.stdout:
-                    output.append(line.rstrip())
-                    broadcast_sse({
-                        "type": "download_progress",
-                        "id": task_id,
-                        "line": line.rstrip(),
-                    })
-
-                proc.wait()
-                status = "completed" if proc.returncode == 0 else "failed"
+                if StreamripMain is not None and rip_config_args():
+                    proc, lines = self.rip_worker()
+                    active_downloads[task_id]["proc"] = proc
+
+                    proc.stdin.write(orjson.dumps({
+                        "url": url,
+                        "folder": DOWNLOAD_DIR,
+                        "quality": quality,
+                    }) + b"\n")
+                    proc.stdin.flush()
+
+                    result = self.stream_output(task_id, lines, output)
+                    if result is None:
+                        # exited mid-job (crash, cancel); don't hand the dead
+                        # process and its spent line reader to the next task
+                        proc.wait()
+                        self.rip_proc = None
+
+                    ok = result is not None and result["ok"]
+
+                else:
+                    cmd = [RIP_BIN, *rip_config_args(),
+                           "-f", DOWNLOAD_DIR, "-q", str(quality), "url", url]
+
+                    # own session so a cancel can signal rip and its children
+                    proc = subprocess.Popen(
+                        cmd,
+                        bufsize=65536,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                        env={**os.environ, "PYTHONUNBUFFERED": "1"},
+                        start_new_session=True,
+                    )
+                    active_downloads[task_id]["proc"] = proc
+
+                    self.stream_output(task_id, read_lines(proc.stdout), output)
+                    proc.wait()
+                    ok = proc.returncode == 0
+
+                if active_downloads[task_id].get("cancelled"):
+                    status = "cancelled"
+                elif ok:
+                    status = "completed"
+                else:
+                    status = "failed"
+
+                log = "\n".join(output)
 
                 broadcast_sse({
                     "type": "download_completed",
                     "id": task_id,
                     "status": status,
-                    "output": "\n".join(output),
+                    "output": log,
                     "metadata": metadata,
                 })
 
             except Exception as e:
+                output.append(str(e))
                 broadcast_sse({
                     "type": "download_error",
                     "id": task_id,
@@ -213,7 +545,14 @@ class DownloadWorker(threading.Thread):
 
             finally:
                 active_downloads.pop(task_id, None)
-                download_queue.task_done()
+                record_history({
+                    "id": task_id,
+                    "status": status,
+                    "metadata": metadata,
+                    "output": log if log is not None else "\n".join(output),
+                    "completed_at": time.time(),
+                })
+                invalidate_browse_cache()
 
 
 for _ in range(MAX_CONCURRENT_DOWNLOADS):
@@ -236,10 +575,14 @@ def api_download():
     quality = data.get("quality", 3)
     metadata = data.get("metadata", {})
 
-    if not url:
+    if not isinstance(url, str) or not url.strip():
         return jsonify({"error": "URL required"}), 400
 
-    task_id = f"dl_{int(time.time()*1000)}"
+    url = url.strip()
+    if not SUPPORTED_URL_RE.match(url):
+        return jsonify({"error": "Unsupported URL"}), 400
+
+    task_id = f"dl_{next(task_ids)}"
     download_queue.put({
         "id": task_id,
         "url": url,
@@ -250,6 +593,23 @@ def api_download():
     return jsonify({"task_id": task_id, "status": "queued"})
 
 
+@app.route("/api/cancel", methods=["POST"])
+def api_cancel():
+    data = request.json or {}
+    task = active_downloads.get(data.get("id"))
+
+    if not task or "proc" not in task:
+        return jsonify({"error": "Download not active"}), 404
+
+    task["cancelled"] = True
+    try:
+        os.killpg(task["proc"].pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+    return jsonify({"status": "cancelled"})
+
+
 @app.route("/api/download-from-url", methods=["POST"])
 def api_download_from_url():
     return api_download()
@@ -257,7 +617,9 @@ def api_download_from_url():
 
 @app.route("/api/history", methods=["GET"])
 def api_history():
-    return jsonify(download_history)
+    return Response(
+        stream_with_context(history_lines()), mimetype="application/x-ndjson"
+    )
 
 # ------------------------------------------------------------------------------
 # Delete files / folders
@@ -274,11 +636,13 @@ def api_delete_file():
     if not os.path.exists(full_path):
         return jsonify({"error": "File not found"}), 404
 
+    # clear first so a busy database leaves the file in place
+    if not clear_downloads_db():
+        return jsonify({"error": "Download database is busy, try again"}), 503
+
     try:
         os.remove(full_path)
-
-        if os.path.exists(DOWNLOADS_DB):
-            os.remove(DOWNLOADS_DB)
+        invalidate_browse_cache()
 
         return jsonify({"status": "ok"})
 
@@ -299,11 +663,13 @@ def api_delete_folder():
     if not os.path.exists(full_path):
         return jsonify({"error": "Folder not found"}), 404
 
+    # clear first so a busy database leaves the folder in place
+    if not clear_downloads_db():
+        return jsonify({"error": "Download database is busy, try again"}), 503
+
     try:
         shutil.rmtree(full_path)
-
-        if os.path.exists(DOWNLOADS_DB):
-            os.remove(DOWNLOADS_DB)
+        invalidate_browse_cache()
 
         return jsonify({"status": "ok"})
 
@@ -311,9 +677,215 @@ def api_delete_folder():
         logger.exception("Failed to delete album")
         return jsonify({"error": str(e)}), 500
 
+# ------------------------------------------------------------------------------
+# Downloaded state
+# ------------------------------------------------------------------------------
+DOWNLOADED_SQL = "SELECT 1 FROM downloads WHERE id = ? LIMIT 1"
+DOWNLOADS_DB_TIMEOUT = 0.2
+
+# one shared read-only connection; with gevent a threading.local would be
+# per-greenlet, i.e. per-request, and buy nothing
+downloads_db = {"conn": None}
+downloads_db_lock = threading.Lock()
+
+
+def get_downloads_db():
+    conn = downloads_db["conn"]
+    if conn is not None:
+        return conn
+
+    if not os.path.exists(DOWNLOADS_DB):
+        # rip creates it on the first download; don't create it ourselves
+        return None
+
+    conn = sqlite3.connect(
+        f"file:{DOWNLOADS_DB}?mode=ro", uri=True, check_same_thread=False
+    )
+    conn.execute("PRAGMA query_only=1")
+    conn.execute("PRAGMA mmap_size=67108864")
+    downloads_db["conn"] = conn
+    return conn
+
+
+def clear_downloads_db():
+    # the downloads table only has track ids, no paths, so there is no way
+    # to forget just the deleted files; empty it so they can be downloaded
+    # again, but leave the file (and everyone's connections to it) alone.
+    # Returns False if a download is holding the database: sqlite's busy
+    # wait blocks the whole gevent worker, so give up quickly instead
+    if not os.path.exists(DOWNLOADS_DB):
+        return True
+
+    with downloads_db_lock:
+        conn = sqlite3.connect(
+            DOWNLOADS_DB, timeout=DOWNLOADS_DB_TIMEOUT, isolation_level=None
+        )
+        try:
+            conn.execute("DELETE FROM downloads")
+        except sqlite3.OperationalError as e:
+            if e.sqlite_errorname in ("SQLITE_BUSY", "SQLITE_LOCKED"):
+                return False
+            # table not created yet
+        finally:
+            conn.close()
+
+    return True
+
+
+def is_downloaded(item_id):
+    with downloads_db_lock:
+        conn = get_downloads_db()
+        if conn is None:
+            return False
+
+        try:
+            row = conn.execute(DOWNLOADED_SQL, (item_id,)).fetchone()
+            return row is not None
+
+        except sqlite3.OperationalError:
+            # table not created yet
+            return False
+
+
+def downloaded_ids(item_ids, chunk_size=900):
+    # stay under SQLite's default limit of 999 bound parameters
+    found = set()
+    with downloads_db_lock:
+        conn = get_downloads_db()
+        if conn is None:
+            return found
+
+        try:
+            for i in range(0, len(item_ids), chunk_size):
+                chunk = item_ids[i:i + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(
+                    row[0] for row in conn.execute(
+                        f"SELECT id FROM downloads WHERE id IN ({placeholders})",
+                        chunk,
+                    )
+                )
+
+        except sqlite3.OperationalError:
+            pass
+
+    return found
+
+
+@app.route("/api/is-downloaded", methods=["POST"])
+def api_is_downloaded():
+    data = request.json or {}
+    item_id = data.get("id")
+
+    if not item_id:
+        return jsonify({"error": "id required"}), 400
+
+    # streamrip only records track IDs in its downloads table
+    return jsonify({"downloaded": is_downloaded(str(item_id))})
+
+
+@app.route("/api/is-downloaded-batch", methods=["POST"])
+def api_is_downloaded_batch():
+    data = request.json or {}
+    items = data.get("items")
+
+    if not isinstance(items, list):
+        return jsonify({"error": "items required"}), 400
+
+    item_ids = list({
+        str(item["id"]) for item in items
+        if isinstance(item, dict) and item.get("id")
+    })
+    found = downloaded_ids(item_ids)
+    return jsonify({item_id: item_id in found for item_id in item_ids})
+
 # ------------------------------------------------------------------------------
 # Search
 # ------------------------------------------------------------------------------
+SEARCH_LIMIT = 100
+SEARCH_TIMEOUT = 30
+
+streamrip_loop = None
+streamrip_loop_lock = threading.Lock()
+streamrip_state = {"main": None, "mtime_ns": None}
+streamrip_login_lock = asyncio.Lock()
+
+
+def get_streamrip_loop():
+    # one long-lived loop keeps the logged-in clients and their aiohttp
+    # sessions alive between searches
+    global streamrip_loop
+    with streamrip_loop_lock:
+        if streamrip_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True).start()
+            streamrip_loop = loop
+
+    return streamrip_loop
+
+
+async def get_streamrip_main():
+    mtime_ns = os.stat(STREAMRIP_CONFIG).st_mtime_ns
+    old = streamrip_state["main"]
+    if old is not None and streamrip_state["mtime_ns"] == mtime_ns:
+        return old
+
+    # config changed on disk (or first use): start over with fresh clients
+    main = StreamripMain(StreamripConfig(STREAMRIP_CONFIG))
+    streamrip_state.update(main=main, mtime_ns=mtime_ns)
+    if old is not None:
+        await old.__aexit__(None, None, None)
+
+    return main
+
+
+async def streamrip_search(source, kind, query):
+    main = await get_streamrip_main()
+    client = main.clients[source]
+
+    if not client.logged_in:
+        async with streamrip_login_lock:
+            if not client.logged_in:
+                await client.login()
+                # login may fetch a fresh app id / secrets; persist them
+                # without making the next search think the config changed
+                main.config.save_file()
+                streamrip_state["mtime_ns"] = os.stat(STREAMRIP_CONFIG).st_mtime_ns
+
+    pages = await client.search(kind, query, limit=SEARCH_LIMIT)
+    if not pages:
+        return []
+
+    return SearchResults.from_pages(source, kind, pages).as_list(source)
+
+
+def rip_search(source, kind, query):
+    # results go to a temp file rather than a pipe: rip's stdout and stderr
+    # carry console output, warnings and tracebacks that would corrupt the
+    # JSON, and stderr is kept for diagnostics
+    with tempfile.NamedTemporaryFile(suffix=".json") as tmp:
+        cmd = [RIP_BIN, *rip_config_args(),
+               "search", "--output-file", tmp.name, source, kind, query]
+
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        if result.returncode != 0:
+            logger.error(
+                "rip search failed: %s",
+                result.stderr.decode("utf-8", "replace").strip(),
+            )
+            return None
+
+        with open(tmp.name, "rb") as f:
+            data = f.read()
+
+    # rip writes nothing at all when there are no results
+    return orjson.loads(data) if data.strip() else []
+
+
 @app.route("/api/search", methods=["POST"])
 def api_search():
     data = request.json or {}
@@ -324,85 +896,312 @@ def api_search():
     if not query:
         return jsonify({"error": "query required"}), 400
 
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        out = tmp.name
-
-    cmd = ["rip"]
-    if os.path.exists(STREAMRIP_CONFIG):
-        cmd += ["--config-path", STREAMRIP_CONFIG]
+    try:
+        if StreamripMain is not None and rip_config_args():
+            items = asyncio.run_coroutine_threadsafe(
+                streamrip_search(source, kind, query),
+                get_streamrip_loop(),
+            ).result(timeout=SEARCH_TIMEOUT)
+        else:
+            items = rip_search(source, kind, query)
 
-    cmd += ["search", "--output-file", out, source, kind, query]
+    except Exception:
+        logger.exception("search error")
+        items = None
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
+    if items is None:
         return jsonify({"error": "search failed"}), 500
 
-    try:
-        with open(out) as f:
-            items = json.load(f)
-    finally:
-        os.unlink(out)
-
-    results = []
-    for i in items:
-        results.append({
-            "id": i.get("id"),
-            "service": i.get("source", source),
-            "type": i.get("media_type", kind),
-            "title": i.get("desc"),
-            "artist": i.get("artist"),
-            "url": f"https://open.qobuz.com/{i.get('media_type')}/{i.get('id')}",
-        })
-
-    return jsonify({"results": results})
+    def gen():
+        for i in items:
+            yield orjson.dumps({
+                "id": i.get("id"),
+                "service": i.get("source", source),
+                "type": i.get("media_type", kind),
+                "title": i.get("desc"),
+                "artist": i.get("artist"),
+                "url": f"https://open.qobuz.com/{i.get('media_type')}/{i.get('id')}",
+            }) + b"\n"
+
+    return Response(stream_with_context(gen()), mimetype="application/x-ndjson")
 
 # ------------------------------------------------------------------------------
 # File browser
 # ------------------------------------------------------------------------------
-@app.route("/api/browse", methods=["GET"])
-def api_browse():
-    items = []
+BROWSE_CACHE_CONTROL = "private, no-cache"
 
-    if not os.path.exists(DOWNLOAD_DIR):
-        return jsonify(items)
+browse_cache = {"key": None, "body": b"", "etag": None, "generation": 0}
+browse_cache_lock = threading.Lock()
 
-    for entry in sorted(os.listdir(DOWNLOAD_DIR)):
-        full_path = os.path.join(DOWNLOAD_DIR, entry)
 
-        if os.path.isdir(full_path):
+def invalidate_browse_cache():
+    # the root mtime only changes when top-level entries come and go,
+    # so anything touching files inside an album folder bumps this too
+    with browse_cache_lock:
+        browse_cache["generation"] += 1
+
+
+def scan_dir(path):
+    with os.scandir(path) as it:
+        return sorted(it, key=lambda e: e.name)
+
+
+def browse_lines():
+    for entry in scan_dir(DOWNLOAD_DIR):
+        if entry.is_dir():
             tracks = []
-            for f in sorted(os.listdir(full_path)):
-                fp = os.path.join(full_path, f)
-                if os.path.isfile(fp):
+            for f in scan_dir(entry.path):
+                if f.is_file():
+                    st = f.stat()
                     tracks.append({
-                        "name": f,
-                        "path": os.path.relpath(fp, DOWNLOAD_DIR),
-                        "size": os.path.getsize(fp),
-                        "modified": os.path.getmtime(fp),
+                        "name": f.name,
+                        "path": os.path.relpath(f.path, DOWNLOAD_DIR),
+                        "size": st.st_size,
+                        "modified": st.st_mtime,
                     })
 
-            items.append({
+            yield orjson.dumps({
                 "type": "album",
-                "name": entry,
+                "name": entry.name,
                 "tracks": tracks,
-            })
+            }) + b"\n"
 
-        elif os.path.isfile(full_path):
-            items.append({
+        elif entry.is_file():
+            st = entry.stat()
+            yield orjson.dumps({
                 "type": "file",
-                "name": entry,
-                "path": entry,
-                "size": os.path.getsize(full_path),
-                "modified": os.path.getmtime(full_path),
-            })
+                "name": entry.name,
+                "path": entry.name,
+                "size": st.st_size,
+                "modified": st.st_mtime,
+            }) + b"\n"
 
-    return jsonify(items)
+
+@app.route("/api/browse", methods=["GET"])
+def api_browse():
+    try:
+        mtime_ns = os.stat(DOWNLOAD_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return Response("", mimetype="application/x-ndjson")
+
+    with browse_cache_lock:
+        key = (mtime_ns, browse_cache["generation"])
+        if browse_cache["key"] == key:
+            body, etag = browse_cache["body"], browse_cache["etag"]
+        else:
+            body = etag = None
+
+    if body is not None:
+        if etag_matches(etag):
+            return not_modified(etag, BROWSE_CACHE_CONTROL)
+
+        return with_cache_headers(
+            Response(body, mimetype="application/x-ndjson"),
+            etag,
+            BROWSE_CACHE_CONTROL,
+        )
+
+    def gen():
+        lines = []
+        for line in browse_lines():
+            lines.append(line)
+            yield line
+
+        body = b"".join(lines)
+        with browse_cache_lock:
+            browse_cache["key"] = key
+            browse_cache["body"] = body
+            browse_cache["etag"] = hashlib.md5(body).hexdigest()
+
+    return Response(stream_with_context(gen()), mimetype="application/x-ndjson")
 
 # ------------------------------------------------------------------------------
 # Qobuz helpers / quality / artwork
 # ------------------------------------------------------------------------------
+QOBUZ_API_URL = "https://www.qobuz.com/api.json/0.2"
+QOBUZ_CACHE_TTL = 300
+QOBUZ_CACHE_SIZE = 512
+QOBUZ_APP_ID_REFRESH = 3600
+QOBUZ_TIMEOUT = 5
+QOBUZ_RETRIES = 2
+QOBUZ_BACKOFF = 0.2
+# longest a track/get or album/get can take: every attempt hitting both the
+# connect and the read timeout, plus the backoff sleeps between them
+QOBUZ_FETCH_MAX = (
+    (QOBUZ_RETRIES + 1) * 2 * QOBUZ_TIMEOUT
+    + sum(QOBUZ_BACKOFF * 2 ** n for n in range(QOBUZ_RETRIES))
+)
+ALBUM_ART_CACHE_CONTROL = "private, max-age=86400"
+
+QOBUZ_BUNDLE_RE = re.compile(
+    r'<script src="(/resources/\d+\.\d+\.\d+-[a-z]\d{3}/bundle\.js)"></script>'
+)
+QOBUZ_APP_ID_RE = re.compile(r'production:{api:{appId:"(\d{9})"')
+
+qobuz_app_id = {"value": "798273057"}
+
+qobuz_cache = {}
+qobuz_inflight = {}
+qobuz_cache_lock = threading.Lock()
+
+qobuz_session = requests.Session()
+qobuz_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    # Retry-After is ignored so a 429 can't stretch a fetch past
+    # QOBUZ_FETCH_MAX while other requests wait on it
+    max_retries=Retry(
+        total=QOBUZ_RETRIES,
+        backoff_factor=QOBUZ_BACKOFF,
+        status_forcelist=(429, 502, 503),
+        respect_retry_after_header=False,
+    ),
+))
+
+
 def get_qobuz_app_id():
-    return "798273057"
+    return qobuz_app_id["value"]
+
+
+def discover_qobuz_app_id():
+    # streamrip stores the app id it last logged in with; only scrape the
+    # web player bundle when the config does not have one
+    try:
+        with open(STREAMRIP_CONFIG, "rb") as f:
+            app_id = tomllib.load(f).get("qobuz", {}).get("app_id")
+        if app_id:
+            return str(app_id)
+    except (OSError, tomllib.TOMLDecodeError):
+        pass
+
+    page = qobuz_session.get("https://play.qobuz.com/login", timeout=10).text
+    match = QOBUZ_BUNDLE_RE.search(page)
+    if match is None:
+        return None
+
+    bundle = qobuz_session.get(
+        "https://play.qobuz.com" + match.group(1), timeout=30
+    ).text
+    match = QOBUZ_APP_ID_RE.search(bundle)
+    return match.group(1) if match else None
+
+
+class QobuzAppIdRefresher(threading.Thread):
+    daemon = True
+
+    def run(self):
+        while True:
+            try:
+                app_id = discover_qobuz_app_id()
+                if app_id and app_id != qobuz_app_id["value"]:
+                    logger.info("Using Qobuz app id %s", app_id)
+                    qobuz_app_id["value"] = app_id
+            except Exception:
+                logger.exception("qobuz app id refresh failed")
+
+            time.sleep(QOBUZ_APP_ID_REFRESH)
+
+
+QobuzAppIdRefresher().start()
+
+
+def fetch_qobuz_item(media_type, item_id):
+    # quality + album art are requested in parallel for the same item,
+    # so both endpoints share one cached track/get or album/get response
+    # and concurrent misses wait on a single in-flight fetch
+    kind = "track" if media_type == "track" else "album"
+    key = (kind, item_id)
+    now = time.monotonic()
+
+    with qobuz_cache_lock:
+        hit = qobuz_cache.get(key)
+        if hit and now - hit[0] < QOBUZ_CACHE_TTL:
+            # move to the end so eviction drops the least recently used
+            qobuz_cache[key] = qobuz_cache.pop(key)
+            return hit[1]
+
+        pending = qobuz_inflight.get(key)
+        owner = pending is None
+        if owner:
+            pending = qobuz_inflight[key] = {
+                "done": threading.Event(), "data": None,
+            }
+
+    if not owner:
+        # the owner hands over whatever it got, including a failed fetch
+        if not pending["done"].wait(timeout=QOBUZ_FETCH_MAX + 1):
+            logger.warning("qobuz %s/get %s timed out", kind, item_id)
+            return None
+        return pending["data"]
+
+    data = None
+    try:
+        r = qobuz_session.get(
+            f"{QOBUZ_API_URL}/{kind}/get",
+            params={f"{kind}_id": item_id, "app_id": get_qobuz_app_id()},
+            timeout=QOBUZ_TIMEOUT,
+        )
+        if r.status_code != 200:
+            return None
+
+        data = orjson.loads(r.content)
+        with qobuz_cache_lock:
+            qobuz_cache.pop(key, None)
+            qobuz_cache[key] = (now, data)
+            while len(qobuz_cache) > QOBUZ_CACHE_SIZE:
+                qobuz_cache.pop(next(iter(qobuz_cache)))
+
+        return data
+
+    finally:
+        pending["data"] = data
+        with qobuz_cache_lock:
+            qobuz_inflight.pop(key, None)
+        pending["done"].set()
+
+
+def qobuz_quality(data):
+    return {
+        "bit_depth": data.get("maximum_bit_depth"),
+        "sample_rate": data.get("maximum_sampling_rate"),
+        "channels": data.get("maximum_channel_count"),
+        "hires": data.get("hires"),
+        "label": data.get("maximum_technical_specifications"),
+    }
+
+
+def qobuz_album_art(media_type, data):
+    if media_type == "track":
+        image = data.get("album", {}).get("image", {}).get("large")
+    else:
+        image = data.get("image", {}).get("large")
+
+    return image or ""
+
+
+@app.route("/api/track-info")
+def api_track_info():
+    # quality badge + artwork for one search result in a single round-trip
+    source = request.args.get("source")
+    media_type = request.args.get("type")
+    item_id = request.args.get("id")
+
+    if source != "qobuz" or not item_id:
+        return jsonify({"quality": None, "album_art": ""})
+
+    try:
+        data = fetch_qobuz_item(media_type, item_id)
+        if data is None:
+            return jsonify({"quality": None, "album_art": ""})
+
+        return jsonify({
+            "quality": qobuz_quality(data),
+            "album_art": qobuz_album_art(media_type, data),
+        })
+
+    except Exception:
+        logger.exception("track info error")
+        return jsonify({"quality": None, "album_art": ""})
 
 
 @app.route("/api/quality", methods=["POST"])
@@ -416,29 +1215,11 @@ def api_quality():
         return jsonify({"quality": None})
 
     try:
-        app_id = get_qobuz_app_id()
-
-        if media_type == "track":
-            url = "https://www.qobuz.com/api.json/0.2/track/get"
-            params = {"track_id": item_id, "app_id": app_id}
-        else:
-            url = "https://www.qobuz.com/api.json/0.2/album/get"
-            params = {"album_id": item_id, "app_id": app_id}
-
-        r = requests.get(url, params=params, timeout=5)
-        if r.status_code != 200:
+        data = fetch_qobuz_item(media_type, item_id)
+        if data is None:
             return jsonify({"quality": None})
 
-        data = r.json()
-        quality = {
-            "bit_depth": data.get("maximum_bit_depth"),
-            "sample_rate": data.get("maximum_sampling_rate"),
-            "channels": data.get("maximum_channel_count"),
-            "hires": data.get("hires"),
-            "label": data.get("maximum_technical_specifications"),
-        }
-
-        return jsonify({"quality": quality})
+        return jsonify({"quality": qobuz_quality(data)})
 
     except Exception:
         logger.exception("quality error")
@@ -454,25 +1235,19 @@ def api_album_art():
     if source != "qobuz" or not item_id:
         return jsonify({"album_art": ""})
 
-    try:
-        app_id = get_qobuz_app_id()
+    # artwork for a given item never changes, so the id is enough
+    etag = f"art-{media_type}-{item_id}"
+    if etag_matches(etag):
+        return not_modified(etag, ALBUM_ART_CACHE_CONTROL)
 
-        if media_type == "track":
-            r = requests.get(
-                "https://www.qobuz.com/api.json/0.2/track/get",
-                params={"track_id": item_id, "app_id": app_id},
-                timeout=5,
-            )
-            image = r.json().get("album", {}).get("image", {}).get("large")
-        else:
-            r = requests.get(
-                "https://www.qobuz.com/api.json/0.2/album/get",
-                params={"album_id": item_id, "app_id": app_id},
-                timeout=5,
-            )
-            image = r.json().get("image", {}).get("large")
+    try:
+        image = qobuz_album_art(media_type, fetch_qobuz_item(media_type, item_id) or {})
+        if not image:
+            return jsonify({"album_art": ""})
 
-        return jsonify({"album_art": image or ""})
+        return with_cache_headers(
+            jsonify({"album_art": image}), etag, ALBUM_ART_CACHE_CONTROL
+        )
 
     except Exception:
         logger.exception("album art error")
@@ -481,13 +1256,30 @@ def api_album_art():
 # ------------------------------------------------------------------------------
 # Config
 # ------------------------------------------------------------------------------
+CONFIG_CACHE_CONTROL = "private, max-age=5"
+
+
 @app.route("/api/config", methods=["GET"])
 def api_config():
-    if not os.path.exists(STREAMRIP_CONFIG):
+    try:
+        st = os.stat(STREAMRIP_CONFIG)
+    except FileNotFoundError:
         return jsonify({"config": ""})
 
+    etag = f"{st.st_mtime_ns}-{st.st_size}"
+    if etag_matches(etag):
+        return not_modified(etag, CONFIG_CACHE_CONTROL)
+
     with open(STREAMRIP_CONFIG) as f:
-        return jsonify({"config": f.read()})
+        return with_cache_headers(
+            jsonify({"config": f.read()}), etag, CONFIG_CACHE_CONTROL
+        )
+
+
+@app.route("/api/reload-config", methods=["POST"])
+def api_reload_config():
+    # re-stat the config right away instead of waiting for the next check
+    return jsonify({"config_found": bool(reload_config_args())})
 
 
 # ------------------------------------------------------------------------------
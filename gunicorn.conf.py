@@ -0,0 +1,8 @@
+# Downloads, history and SSE clients live in process memory, so everything
+# has to run in a single worker. gevent lets that one worker hold many
+# long-lived /api/events streams without a thread per connection.
+bind = "0.0.0.0:5000"
+worker_class = "gevent"
+workers = 1
+worker_connections = 1000
+timeout = 60
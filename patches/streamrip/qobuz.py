@@ -133,9 +133,13 @@ class QobuzClient(Client):
     def __init__(self, config: Config):
         self.logged_in = False
         self.config = config
+        # requests_per_minute caps all calls together; on top of that each
+        # endpoint group (user/, track/, album/, ...) gets at most half of
+        # it, so a burst of metadata calls can't starve file url lookups
         self.rate_limiter = self.get_rate_limiter(
             config.session.downloads.requests_per_minute
         )
+        self.rate_limiters: dict = {}
         self.secret: Optional[str] = None
 
     async def login(self):
@@ -259,9 +263,20 @@ class QobuzClient(Client):
 
         return await self._api_request("track/getFileUrl", params)
 
+    def _rate_limiter(self, epoint: str):
+        group = epoint.split("/", 1)[0]
+        limiter = self.rate_limiters.get(group)
+        if limiter is None:
+            rpm = self.config.session.downloads.requests_per_minute
+            limiter = self.rate_limiters[group] = self.get_rate_limiter(
+                max(rpm // 2, 1) if rpm > 0 else 0
+            )
+
+        return limiter
+
     async def _api_request(self, epoint: str, params: dict) -> tuple[int, dict]:
         url = f"{QOBUZ_BASE_URL}/{epoint}"
-        async with self.rate_limiter:
+        async with self._rate_limiter(epoint), self.rate_limiter:
             async with self.session.get(url, params=params) as r:
                 return r.status, await r.json()
 
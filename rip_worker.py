@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import sys
+
+import orjson
+import tomlkit
+from streamrip import progress
+from streamrip.config import Config
+from streamrip.db import DatabaseBase
+from streamrip.media import artwork, remove_artwork_tempdirs
+from streamrip.rip.main import Main
+
+# ------------------------------------------------------------------------------
+# Long-lived download helper for app.py
+#
+# Reads one JSON job per line on stdin and downloads it with a Main whose
+# clients stay logged in, so interpreter start-up, imports and logins are
+# paid once per process instead of once per download. Everything streamrip
+# prints is the job log; a DONE line with the result ends each job.
+# ------------------------------------------------------------------------------
+DONE = "__rip_worker_done__ "  # must match RIP_WORKER_DONE in app.py
+
+logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+logger = logging.getLogger("streamrip")
+
+state = {"main": None, "mtime_ns": None}
+
+# streamrip has no public way to reset its progress display or the set of
+# embed-cover dirs between runs, so reset_streamrip_globals() touches these
+# private module globals; refuse to start on a release that renamed them
+if not (
+    isinstance(getattr(progress, "_p", None), progress.ProgressManager)
+    and isinstance(getattr(artwork, "_artwork_tempdirs", None), set)
+):
+    raise RuntimeError(
+        "rip_worker.py: this streamrip version has no progress._p / "
+        "artwork._artwork_tempdirs; update reset_streamrip_globals()"
+    )
+
+
+def reset_streamrip_globals():
+    # what Main.__aexit__ does at the end of a `rip url` run: stop the
+    # progress display (with a fresh manager so finished tasks don't pile
+    # up) and remove the embed covers' __artwork dirs
+    progress.clear_progress()
+    progress._p = progress.ProgressManager()
+    remove_artwork_tempdirs()
+    artwork._artwork_tempdirs.clear()
+
+
+def save_config(config):
+    # Config.save_file() rewrites config.toml whenever file.modified is set,
+    # and nothing ever clears it, so after the first login every job would
+    # bump the mtime and make the other workers and search log in again;
+    # only write when the contents really changed
+    if not config.file.modified:
+        return
+
+    config.file.update_toml()
+    try:
+        with open(config.path) as f:
+            if f.read() == tomlkit.dumps(config.file.toml):
+                return
+    except OSError:
+        pass
+
+    config.save_file()
+
+
+async def get_main(config_path):
+    mtime_ns = os.stat(config_path).st_mtime_ns
+    old = state["main"]
+    if old is not None and state["mtime_ns"] == mtime_ns:
+        return old
+
+    # config changed on disk (or first job): start over with fresh clients
+    main = Main(Config(config_path))
+    state.update(main=main, mtime_ns=mtime_ns)
+    if old is not None:
+        await old.__aexit__(None, None, None)
+
+    return main
+
+
+async def download(config_path, job):
+    main = await get_main(config_path)
+
+    session = main.config.session
+    session.downloads.folder = job["folder"]
+    for source in (session.qobuz, session.tidal, session.deezer, session.soundcloud):
+        source.quality = int(job["quality"])
+
+    # streamrip only creates its databases on start-up
+    for table in (main.database.downloads, main.database.failed):
+        if isinstance(table, DatabaseBase) and not os.path.exists(table.path):
+            table.create()
+
+    try:
+        await main.add(job["url"])
+        await main.resolve()
+        await main.rip()
+
+    finally:
+        main.pending.clear()
+        main.media.clear()
+        reset_streamrip_globals()
+        # login may fetch a fresh app id / secrets; persist them without
+        # making the next job think the config changed
+        save_config(main.config)
+        state["mtime_ns"] = os.stat(config_path).st_mtime_ns
+
+
+def run(config_path):
+    jobs = sys.stdin.buffer
+    # a credentials prompt would otherwise swallow the next job line
+    sys.stdin = open(os.devnull)
+
+    loop = asyncio.new_event_loop()
+    for line in jobs:
+        if not line.strip():
+            continue
+
+        try:
+            loop.run_until_complete(download(config_path, orjson.loads(line)))
+            result = {"ok": True}
+
+        except Exception as e:
+            logger.exception("download error")
+            result = {"ok": False, "error": str(e)}
+
+        sys.stdout.write(DONE + orjson.dumps(result).decode() + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    run(sys.argv[1])
@@ -20,6 +20,44 @@ const downloadedCache = new Map();
 
 
 
+/* ===============================
+   NDJSON
+================================ */
+
+// parses the body line by line as it arrives instead of buffering the
+// whole response as one string; onItem, if given, sees each item early
+async function readNDJSON(res, onItem) {
+    const items = [];
+    const push = line => {
+        if (!line.trim()) return;
+        const item = JSON.parse(line);
+        items.push(item);
+        if (onItem) onItem(item);
+    };
+
+    if (!res.body) {
+        (await res.text()).split('\n').forEach(push);
+        return items;
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.forEach(push);
+    }
+
+    push(buffer + decoder.decode());
+    return items;
+}
+
 /* ===============================
    SSE
 ================================ */
@@ -74,8 +112,9 @@ function handleDownloadProgress(data) {
     const d = activeDownloads.get(data.id);
     if (!d) return;
 
-    if (data.line) {
-        d.logs.push(data.line);
+    const lines = data.lines || (data.line ? [data.line] : []);
+    if (lines.length) {
+        d.logs.push(...lines);
         updateDownloadLog(data.id, d.logs);
     }
 }
@@ -157,6 +196,9 @@ function renderActiveDownloads() {
                             onclick="document.getElementById('log-wrap-${d.id}').classList.toggle('visible')">
                         SHOW LOG
                     </button>
+                    <button class="toggle-log-btn" onclick="cancelDownload('${d.id}')">
+                        CANCEL
+                    </button>
                 </div>
 
                 <div class="download-spinner"></div>
@@ -169,6 +211,19 @@ function renderActiveDownloads() {
     `).join('');
 }
 
+async function cancelDownload(id) {
+    try {
+        await fetch('/api/cancel', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ id })
+        });
+    } catch (err) {
+        console.warn('cancel failed', err);
+    }
+}
+
+
 
 /* ===============================
    SEARCH
@@ -198,16 +253,16 @@ async function searchMusic() {
         body: JSON.stringify({ query, type: currentSearchType, source })
     });
 
-    const data = await res.json();
-
-    if (!res.ok || !data.results) {
+    if (!res.ok) {
         document.getElementById('searchResults').innerHTML =
             '<div class="empty-state">SEARCH FAILED</div>';
         return;
     }
 
-    allSearchResults = data.results;
-    totalResults = data.results.length;
+    const results = await readNDJSON(res);
+
+    allSearchResults = results;
+    totalResults = results.length;
     currentPage = 1;
     displayCurrentPage();
 }
@@ -264,46 +319,43 @@ function displayCurrentPage() {
     `).join('');
 
     updatePaginationControls();
-    loadAlbumArtForVisibleItems();
-    inspectVisibleMediaQuality();
+    loadVisibleTrackInfo();
     inspectDownloadedState();
 }
 
 
 
 async function inspectDownloadedState() {
-    const items = document.querySelectorAll('.search-result-item');
-
-    for (const el of items) {
-        const source = el.dataset.source;
-        const type = el.dataset.type;
-        const id = el.dataset.id;
+    const items = [...document.querySelectorAll('.search-result-item')]
+        .filter(el => el.querySelector('.result-download-btn'));
+    if (!items.length) return;
 
-        const btn = el.querySelector('.result-download-btn');
-        if (!btn) continue;
-
-        try {
-            const res = await fetch('/api/is-downloaded', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ source, type, id })
-            });
+    try {
+        const res = await fetch('/api/is-downloaded-batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                items: items.map(el => ({
+                    source: el.dataset.source,
+                    type: el.dataset.type,
+                    id: el.dataset.id
+                }))
+            })
+        });
 
-            const data = await res.json();
+        const data = await res.json();
 
-            if (data.downloaded) {
-                btn.disabled = true;
-                btn.textContent = 'DOWNLOADED';
-                btn.classList.add('downloaded');
-            } else if (data.file_exists) {
-                btn.disabled = true;
-                btn.textContent = 'EXISTS';
-                btn.classList.add('exists');
-            }
+        for (const el of items) {
+            if (!data[el.dataset.id]) continue;
 
-        } catch (err) {
-            console.warn('download check failed', err);
+            const btn = el.querySelector('.result-download-btn');
+            btn.disabled = true;
+            btn.textContent = 'DOWNLOADED';
+            btn.classList.add('downloaded');
         }
+
+    } catch (err) {
+        console.warn('download check failed', err);
     }
 }
 
@@ -343,16 +395,12 @@ function changePage(dir) {
 
 
 
-async function fetchMediaQuality(source, type, id) {
+async function fetchTrackInfo(source, type, id) {
     const key = `${source}:${type}:${id}`;
     if (qualityCache.has(key)) return qualityCache.get(key);
 
-    const res = await fetch('/api/quality', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ source, type, id })
-    });
-
+    const params = new URLSearchParams({ source, type, id });
+    const res = await fetch(`/api/track-info?${params}`);
     const data = await res.json();
     qualityCache.set(key, data);
     return data;
@@ -396,11 +444,15 @@ function applyQuality(id, data) {
 
 
 
-function inspectVisibleMediaQuality() {
+function loadVisibleTrackInfo() {
     document.querySelectorAll('.search-result-item').forEach(async el => {
         const { source, type, id } = el.dataset;
-        if (source === 'qobuz' && (type === 'track' || type === 'album')) {
-            const data = await fetchMediaQuality(source, type, id);
+        if (source !== 'qobuz') return;
+
+        const data = await fetchTrackInfo(source, type, id);
+        applyAlbumArt(id, data.album_art);
+
+        if (type === 'track' || type === 'album') {
             applyQuality(id, data);
         }
     });
@@ -410,20 +462,14 @@ function inspectVisibleMediaQuality() {
    ALBUM ART
 ================================ */
 
-async function loadAlbumArtForVisibleItems() {
-    document.querySelectorAll('.search-result-item').forEach(async el => {
-        const { id, source, type } = el.dataset;
-
-        const res = await fetch(`/api/album-art?source=${source}&type=${type}&id=${id}`);
-        const data = await res.json();
-        if (!data.album_art) return;
+function applyAlbumArt(id, url) {
+    if (!url) return;
 
-        const art = document.getElementById(`art-${id}`);
-        if (art) {
-            art.innerHTML = `<img src="${data.album_art}" class="result-album-art">`;
-            art.classList.remove('placeholder');
-        }
-    });
+    const art = document.getElementById(`art-${id}`);
+    if (art) {
+        art.innerHTML = `<img src="${url}" class="result-album-art">`;
+        art.classList.remove('placeholder');
+    }
 }
 
 
@@ -513,7 +559,7 @@ async function loadConfig() {
 async function loadFiles() {
     try {
         const res = await fetch('/api/browse');
-        const items = await res.json();
+        const items = await readNDJSON(res);
 
         const container = document.getElementById('fileList');
 
@@ -671,12 +717,12 @@ function renderDownloadHistory() {
     }
 
     el.innerHTML = downloadHistory.map(d => `
-        <div class="download-item completed">
+        <div class="download-item ${d.status || 'completed'}">
             <div class="download-content">
                 <div class="download-info">
                     <div class="download-title">${d.metadata?.title || 'Unknown'}</div>
                     <div class="download-artist">${d.metadata?.artist || ''}</div>
-                    <span class="status-badge completed">completed</span>
+                    <span class="status-badge ${d.status || 'completed'}">${d.status || 'completed'}</span>
 
                     ${d.logs?.length ? `
                         <button class="toggle-log-btn"
@@ -774,9 +820,37 @@ function applyFilters() {
 
 
 /* ===============================
-   INIT
+   HISTORY
 ================================ */
 
+async function loadDownloadHistory() {
+    try {
+        const res = await fetch('/api/history');
+        const entries = await readNDJSON(res);
+
+        const loaded = entries.map(e => ({
+            id: e.id,
+            metadata: e.metadata || {},
+            status: e.status,
+            output: e.output || '',
+            logs: e.output ? e.output.split('\n') : [],
+            completedAt: e.completed_at * 1000
+        }));
+
+        // keep anything that finished over SSE while this was loading
+        const ids = new Set(loaded.map(d => d.id));
+        downloadHistory = [
+            ...downloadHistory.filter(d => !ids.has(d.id)),
+            ...loaded
+        ];
+
+        if (currentTab === 'history') renderDownloadHistory();
+
+    } catch (err) {
+        console.warn('history load failed', err);
+    }
+}
+
 /* ===============================
    INIT
 ================================ */
@@ -784,4 +858,5 @@ function applyFilters() {
 window.addEventListener('load', () => {
     initializeSSE();
     initFilters();
+    loadDownloadHistory();
 });